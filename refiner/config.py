@@ -61,6 +61,11 @@ class Settings(BaseSettings):
         description="Pinata API secret"
     )
 
+    IPFS_UPLOAD_TIMEOUT: Optional[float] = Field(
+        default=None,
+        description="Maximum time in seconds for an IPFS upload request to complete. Unset means no limit, so large refinements are not cut off mid-upload"
+    )
+
     IPFS_GATEWAY_URL: str = Field(
         default="https://gateway.pinata.cloud/ipfs",
         description="IPFS gateway URL for accessing uploaded files. Recommended to use own dedicated gateway to avoid congestion and rate limiting. Example: 'https://ipfs.my-dao.org/ipfs' (Note: won't work for third-party files)"
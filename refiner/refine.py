@@ -1,16 +1,181 @@
+import asyncio
 import json
 import logging
 import os
+import re
 import sqlite3
+import aiohttp
 import pandas as pd
+import pyarrow as pa
 import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
 from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+from pyarrow import csv as pa_csv
 
 from refiner.models.offchain_schema import OffChainSchema
 from refiner.models.output import Output
 from refiner.config import settings
-from refiner.utils.encrypt import encrypt_file
-from refiner.utils.ipfs import upload_file_to_ipfs, upload_json_to_ipfs
+from refiner.utils.encrypt import encrypt_file_to_stream
+from refiner.utils.ipfs import IPFS_CLIENT_TIMEOUT, upload_fileobj_to_ipfs_async, upload_json_to_ipfs_async
+
+# Larger pages mean shallower B-trees and fewer page writes for append-only bulk loads
+SQLITE_PAGE_SIZE = 32768
+
+# Rows read from a CSV file per chunk
+CSV_CHUNK_SIZE = 50_000
+
+# Files up to this size are parsed in one go by the multi-threaded pyarrow engine
+PYARROW_MAX_FILE_SIZE = 256 * 1024 * 1024
+
+# Netflix viewing activity indicators (actual column names)
+VIEWING_INDICATORS = frozenset({
+    'start time', 'duration', 'title', 'profile name', 'device type', 'bookmark',
+    'start_time', 'duration', 'title', 'profile_name', 'device_type', 'bookmark',
+    'latest bookmark', 'latest_bookmark', 'supplemental video type', 'supplemental_video_type',
+    'attributes', 'country', 'profile', 'device', 'time', 'name'
+})
+
+# Netflix billing history indicators (actual column names)
+BILLING_INDICATORS = frozenset({
+    'transaction date', 'gross sale amt', 'currency', 'payment type', 'pmt status',
+    'transaction_date', 'gross_sale_amt', 'currency', 'payment_type', 'pmt_status',
+    'mop last 4', 'mop_last_4', 'final invoice result', 'final_invoice_result',
+    'mop pmt processor desc', 'mop_pmt_processor_desc', 'pmt txn type', 'pmt_txn_type',
+    'description', 'tax amt', 'tax_amt', 'service period start date', 'service_period_start_date',
+    'item price amt', 'item_price_amt', 'mop creation date', 'mop_creation_date',
+    'next billing date', 'next_billing_date', 'service period end date', 'service_period_end_date',
+    'transaction', 'billing', 'payment', 'invoice', 'amount', 'price'
+})
+
+# Netflix export headers (stripped and lowercased) mapped to standardized column names
+VIEWING_COLUMN_MAPPING = {
+    'start time': 'start_time',
+    'duration': 'duration',
+    'title': 'title',
+    'profile name': 'profile_name',
+    'device type': 'device_type',
+    'country': 'country',
+    'bookmark': 'bookmark',
+    'latest bookmark': 'latest_bookmark',
+    'supplemental video type': 'supplemental_video_type',
+    'attributes': 'attributes'
+}
+
+BILLING_COLUMN_MAPPING = {
+    'transaction date': 'transaction_date',
+    'country': 'country',
+    'mop last 4': 'mop_last_4',
+    'final invoice result': 'final_invoice_result',
+    'mop pmt processor desc': 'mop_pmt_processor_desc',
+    'pmt txn type': 'pmt_txn_type',
+    'description': 'description',
+    'gross sale amt': 'gross_sale_amt',
+    'pmt status': 'pmt_status',
+    'payment type': 'payment_type',
+    'tax amt': 'tax_amt',
+    'service period start date': 'service_period_start_date',
+    'item price amt': 'item_price_amt',
+    'mop creation date': 'mop_creation_date',
+    'currency': 'currency',
+    'next billing date': 'next_billing_date',
+    'service period end date': 'service_period_end_date'
+}
+
+# Types to parse each standardized column with; everything is read as text, amounts are cleaned up later
+VIEWING_DTYPES = {
+    'start_time': 'str',
+    'duration': 'str',
+    'title': 'str',
+    'profile_name': 'str',
+    'device_type': 'str',
+    'country': 'str',
+    'bookmark': 'str',
+    'latest_bookmark': 'str',
+    'supplemental_video_type': 'str',
+    'attributes': 'str'
+}
+
+BILLING_DTYPES = {
+    'transaction_date': 'str',
+    'country': 'str',
+    'mop_last_4': 'str',
+    'final_invoice_result': 'str',
+    'mop_pmt_processor_desc': 'str',
+    'pmt_txn_type': 'str',
+    'description': 'str',
+    'gross_sale_amt': 'str',
+    'pmt_status': 'str',
+    'payment_type': 'str',
+    'tax_amt': 'str',
+    'service_period_start_date': 'str',
+    'item_price_amt': 'str',
+    'mop_creation_date': 'str',
+    'currency': 'str',
+    'next_billing_date': 'str',
+    'service_period_end_date': 'str'
+}
+
+# Characters stripped from billing amounts before numeric conversion
+CURRENCY_NOISE_PATTERN = re.compile(r'[$,]')
+
+# Refined tables and column types, used both to create the database and as the published schema
+NETFLIX_SCHEMA = {
+    "tables": {
+        "viewing_activity": {
+            "columns": {
+                "account_id": "TEXT",
+                "duration": "TEXT",
+                "duration_sec": "INTEGER",
+                "start_time": "TEXT",
+                "profile_name": "TEXT",
+                "country": "TEXT",
+                "bookmark": "TEXT",
+                "latest_bookmark": "TEXT",
+                "supplemental_video_type": "TEXT",
+                "attributes": "TEXT",
+                "device_type": "TEXT",
+                "title": "TEXT"
+            }
+        },
+        "billing_history": {
+            "columns": {
+                "account_id": "TEXT",
+                "transaction_date": "TEXT",
+                "country": "TEXT",
+                "mop_last_4": "TEXT",
+                "final_invoice_result": "TEXT",
+                "mop_pmt_processor_desc": "TEXT",
+                "pmt_txn_type": "TEXT",
+                "description": "TEXT",
+                "gross_sale_amt": "REAL",
+                "pmt_status": "TEXT",
+                "payment_type": "TEXT",
+                "tax_amt": "REAL",
+                "service_period_start_date": "TEXT",
+                "item_price_amt": "REAL",
+                "mop_creation_date": "TEXT",
+                "currency": "TEXT",
+                "next_billing_date": "TEXT",
+                "service_period_end_date": "TEXT"
+            }
+        }
+    }
+}
+
+# Indexes on the refined tables as (table, columns, partial index filter), created only after all data has been loaded
+NETFLIX_INDEXES = {
+    # Covers the common "titles actually watched" queries (WHERE duration_sec > 0 GROUP BY title, summing
+    # duration_sec) so they never touch the table; an index on title alone forces a rowid lookup per row
+    "idx_vas_dur_title": ("viewing_activity", ("title", "duration_sec"), "duration_sec > 0")
+}
+
+# Table each detected CSV file type is loaded into
+FILE_TYPE_TABLES = {
+    'viewing': 'viewing_activity',
+    'billing': 'billing_history'
+}
 
 class Refiner:
     def __init__(self):
@@ -18,34 +183,64 @@ class Refiner:
 
     def _hash_wallet_address(self, wallet_address: str) -> str:
         """Create a privacy-safe account ID from wallet address."""
+        # Keep the SHA-256 derivation fixed: a wallet must map to the same account_id in every refinement
         return hashlib.sha256(wallet_address.encode()).hexdigest()[:16]
 
-    def _detect_file_type(self, df: pd.DataFrame) -> str:
-        """Detect if CSV is viewing activity or billing history."""
-        columns = {col.lower().strip() for col in df.columns}
+    def _configure_connection(self, conn: sqlite3.Connection) -> None:
+        """Tune the SQLite connection for a single-writer bulk load."""
+        conn.isolation_level = 'DEFERRED'
+        # Only takes effect on a new, empty database (and must precede WAL mode); a no-op otherwise
+        conn.execute(f"PRAGMA page_size={SQLITE_PAGE_SIZE}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-200000")
+
+    def _create_tables(self, conn: sqlite3.Connection, account_id: str) -> None:
+        """Create the refined tables, storing account_id as a column default rather than per-row data."""
+        for table, definition in NETFLIX_SCHEMA["tables"].items():
+            columns = []
+            for column, column_type in definition["columns"].items():
+                if column == "account_id":
+                    columns.append(f"{column} {column_type} DEFAULT '{account_id}'")
+                else:
+                    columns.append(f"{column} {column_type}")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})")
+
+    def _create_indexes(self, conn: sqlite3.Connection) -> None:
+        """Create the refined table indexes after the bulk load and gather planner statistics."""
+        for index, (table, columns, where) in NETFLIX_INDEXES.items():
+            sql = f"CREATE INDEX IF NOT EXISTS {index} ON {table}({', '.join(columns)})"
+            if where:
+                sql += f" WHERE {where}"
+            conn.execute(sql)
         
-        # Netflix viewing activity indicators (actual column names)
-        viewing_indicators = {
-            'start time', 'duration', 'title', 'profile name', 'device type', 'bookmark',
-            'start_time', 'duration', 'title', 'profile_name', 'device_type', 'bookmark',
-            'latest bookmark', 'latest_bookmark', 'supplemental video type', 'supplemental_video_type',
-            'attributes', 'country', 'profile', 'device', 'time', 'name'
-        }
+        conn.execute("ANALYZE")
+
+    def _table_layout(self, df: pd.DataFrame, table: str) -> pd.DataFrame:
+        """Order columns as in the table definition and back them with Arrow arrays for insertion."""
+        columns = [col for col in NETFLIX_SCHEMA["tables"][table]["columns"] if col in df.columns]
+        return df[columns].convert_dtypes(dtype_backend='pyarrow')
+
+    def _bulk_insert(self, conn: sqlite3.Connection, table: str, arrow_table: pa.Table) -> None:
+        """Insert Arrow table rows into a pre-created table through a single prepared statement."""
+        columns = ', '.join(arrow_table.column_names)
+        placeholders = ', '.join('?' * arrow_table.num_columns)
         
-        # Netflix billing history indicators (actual column names)
-        billing_indicators = {
-            'transaction date', 'gross sale amt', 'currency', 'payment type', 'pmt status',
-            'transaction_date', 'gross_sale_amt', 'currency', 'payment_type', 'pmt_status',
-            'mop last 4', 'mop_last_4', 'final invoice result', 'final_invoice_result',
-            'mop pmt processor desc', 'mop_pmt_processor_desc', 'pmt txn type', 'pmt_txn_type',
-            'description', 'tax amt', 'tax_amt', 'service period start date', 'service_period_start_date',
-            'item price amt', 'item_price_amt', 'mop creation date', 'mop_creation_date',
-            'next billing date', 'next_billing_date', 'service period end date', 'service_period_end_date',
-            'transaction', 'billing', 'payment', 'invoice', 'amount', 'price'
-        }
+        # Convert column by column from Arrow to Python values (nulls become None) and zip them into rows
+        rows = zip(*(column.to_pylist() for column in arrow_table.columns))
+        conn.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+
+    def _normalize_columns(self, columns: pd.Index) -> pd.Index:
+        """Strip and lowercase CSV headers once so lookups need no per-column normalization."""
+        return pd.Index(columns).str.strip().str.lower()
+
+    def _detect_file_type(self, df: pd.DataFrame) -> str:
+        """Detect if CSV is viewing activity or billing history from its normalized headers."""
+        columns = frozenset(df.columns)
         
-        viewing_score = len(columns & viewing_indicators)
-        billing_score = len(columns & billing_indicators)
+        viewing_score = len(columns & VIEWING_INDICATORS)
+        billing_score = len(columns & BILLING_INDICATORS)
         
         logging.info(f"File detection - Columns found: {list(columns)}")
         logging.info(f"Viewing score: {viewing_score}, Billing score: {billing_score}")
@@ -58,90 +253,156 @@ class Refiner:
             logging.warning(f"Could not determine file type. Columns: {list(columns)}")
             return 'unknown'
 
-    def _process_viewing_activity(self, df: pd.DataFrame, account_id: str) -> pd.DataFrame:
+    def _process_viewing_activity(self, df: pd.DataFrame) -> pd.DataFrame:
         """Process viewing activity CSV into standardized format."""
-        # Create account_id column
-        df['account_id'] = account_id
-        
         # Standardize column names to match real Netflix format
-        column_mapping = {
-            'Start Time': 'start_time',
-            'Duration': 'duration',
-            'Title': 'title',
-            'Profile Name': 'profile_name',
-            'Device Type': 'device_type',
-            'Country': 'country',
-            'Bookmark': 'bookmark',
-            'Latest Bookmark': 'latest_bookmark',
-            'Supplemental Video Type': 'supplemental_video_type',
-            'Attributes': 'attributes'
-        }
-        
-        df = df.rename(columns=column_mapping)
+        df = df.rename(columns=VIEWING_COLUMN_MAPPING)
         
         # Add duration_sec column for easier SQL queries
         if 'duration' in df.columns:
-            df['duration_sec'] = df['duration'].apply(self._parse_duration)
+            df['duration_sec'] = self._parse_durations(df['duration'])
             logging.info(f"Converted {len(df)} duration values to seconds")
         
         return df
 
-    def _process_billing_history(self, df: pd.DataFrame, account_id: str) -> pd.DataFrame:
+    def _process_billing_history(self, df: pd.DataFrame) -> pd.DataFrame:
         """Process billing history CSV into standardized format."""
-        # Create account_id column
-        df['account_id'] = account_id
-        
         # Standardize column names to match real Netflix format
-        column_mapping = {
-            'Transaction Date': 'transaction_date',
-            'Country': 'country',
-            'Mop Last 4': 'mop_last_4',
-            'Final Invoice Result': 'final_invoice_result',
-            'Mop Pmt Processor Desc': 'mop_pmt_processor_desc',
-            'Pmt Txn Type': 'pmt_txn_type',
-            'Description': 'description',
-            'Gross Sale Amt': 'gross_sale_amt',
-            'Pmt Status': 'pmt_status',
-            'Payment Type': 'payment_type',
-            'Tax Amt': 'tax_amt',
-            'Service Period Start Date': 'service_period_start_date',
-            'Item Price Amt': 'item_price_amt',
-            'Mop Creation Date': 'mop_creation_date',
-            'Currency': 'currency',
-            'Next Billing Date': 'next_billing_date',
-            'Service Period End Date': 'service_period_end_date'
-        }
-        
-        df = df.rename(columns=column_mapping)
+        df = df.rename(columns=BILLING_COLUMN_MAPPING)
         
         # Convert numeric columns to proper types
-        numeric_columns = ['gross_sale_amt', 'tax_amt', 'item_price_amt']
-        for col in numeric_columns:
-            if col in df.columns:
-                # Remove currency symbols and convert to float
-                df[col] = df[col].astype(str).str.replace('$', '').str.replace(',', '')
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
+        numeric_columns = [col for col in ('gross_sale_amt', 'tax_amt', 'item_price_amt') if col in df.columns]
+        if numeric_columns:
+            # Remove currency symbols and thousands separators in one regex pass, then convert to float
+            df[numeric_columns] = (
+                df[numeric_columns]
+                .astype('string')
+                .apply(lambda col: col.str.replace(CURRENCY_NOISE_PATTERN, '', regex=True))
+                .apply(pd.to_numeric, errors='coerce')
+                .astype('float64')
+                .fillna(0.0)
+            )
         
         return df
 
-    def _parse_duration(self, duration_str: str) -> int:
-        """Parse Netflix duration string to seconds."""
-        try:
-            if pd.isna(duration_str) or duration_str == "":
-                return 0
+    def _parse_durations(self, durations: pd.Series) -> pd.Series:
+        """Parse Netflix duration strings to seconds in a single vectorized pass."""
+        text = durations.astype('string')
+        
+        # Handle formats like "1:23:45" or "23:45"; anything else becomes 0
+        parts = text.str.split(':', expand=True).reindex(columns=range(3))
+        numbers = parts.apply(pd.to_numeric, errors='coerce')
+        colons = text.str.count(':')
+        
+        hms_seconds = numbers[0] * 3600 + numbers[1] * 60 + numbers[2]  # HH:MM:SS
+        ms_seconds = numbers[0] * 60 + numbers[1]  # MM:SS
+        seconds = hms_seconds.where(colons == 2, ms_seconds.where(colons == 1))
+        
+        return seconds.fillna(0).astype('int64')
+
+    def _csv_read_options(self, columns: pd.Index, file_type: str) -> dict:
+        """Build read_csv arguments that parse only the known columns of a file type."""
+        if file_type == 'viewing':
+            column_mapping, dtypes = VIEWING_COLUMN_MAPPING, VIEWING_DTYPES
+        else:
+            column_mapping, dtypes = BILLING_COLUMN_MAPPING, BILLING_DTYPES
+        
+        # Accept both the raw export header and the already-standardized name
+        names = self._normalize_columns(columns)
+        selected = {col: column_mapping.get(name, name) for col, name in zip(columns, names)}
+        selected = {col: name for col, name in selected.items() if name in dtypes}
+        return {
+            'usecols': list(selected),
+            'dtype': {col: dtypes[name] for col, name in selected.items()}
+        }
+
+    def _read_csv(self, input_file: str, read_options: dict) -> Iterator[pd.DataFrame]:
+        """Yield the contents of a CSV file as one or more DataFrames."""
+        if os.path.getsize(input_file) <= PYARROW_MAX_FILE_SIZE:
+            # Declare column types up front, otherwise pyarrow reinterprets values such as "00:45" as times
+            convert_options = pa_csv.ConvertOptions(
+                include_columns=read_options['usecols'],
+                column_types={col: pa.string() for col in read_options['dtype']},
+                strings_can_be_null=True
+            )
+            # Quoted titles and descriptions may span lines, which pandas accepts but pyarrow only parses when told to
+            parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+            table = pa_csv.read_csv(input_file, parse_options=parse_options, convert_options=convert_options)
+            chunks = [table.to_pandas(types_mapper=pd.ArrowDtype)]
+        else:
+            # The pyarrow engine cannot stream, so fall back to chunked reads with the C engine
+            chunks = pd.read_csv(input_file, chunksize=CSV_CHUNK_SIZE, engine='c', **read_options)
+        
+        for df in chunks:
+            df.columns = self._normalize_columns(df.columns)
+            yield df
+
+    def _process_chunk(self, df: pd.DataFrame, file_type: str) -> pa.Table:
+        """Process one chunk of a CSV file into an Arrow table laid out like its target table."""
+        if file_type == 'viewing':
+            processed_df = self._process_viewing_activity(df)
+        else:
+            processed_df = self._process_billing_history(df)
+        
+        processed_df = self._table_layout(processed_df, FILE_TYPE_TABLES[file_type])
+        return pa.Table.from_pandas(processed_df, preserve_index=False)
+
+    def _detect_csv_file(self, input_file: str) -> Tuple[str, dict]:
+        """Detect the type of a CSV file from its header and build the options to read it with."""
+        logging.info(f"Processing {os.path.basename(input_file)}")
+        
+        # Detect file type from the header alone before parsing any rows
+        header_df = pd.read_csv(input_file, nrows=0)
+        raw_columns = header_df.columns
+        header_df.columns = self._normalize_columns(raw_columns)
+        file_type = self._detect_file_type(header_df)
+        logging.info(f"Detected file type: {file_type}")
+        
+        if file_type == 'unknown':
+            logging.warning(f"Unknown file type for {os.path.basename(input_file)}, skipping")
+            return file_type, {}
+        
+        # Generic indicators such as "profile" can match a file none of whose columns belong to the schema
+        read_options = self._csv_read_options(raw_columns, file_type)
+        if not read_options['usecols']:
+            logging.warning(f"No {file_type} columns found in {os.path.basename(input_file)}, skipping")
+            return 'unknown', {}
+        
+        return file_type, read_options
+
+    def _process_csv_file(self, input_file: str, file_type: str, read_options: dict) -> Iterator[pa.Table]:
+        """Read and process a CSV file, yielding one Arrow table per chunk."""
+        # Read CSV file, in chunks when it is too large to hold in memory
+        for df in self._read_csv(input_file, read_options):
+            logging.info(f"Loaded CSV chunk with {len(df)} rows and columns: {list(df.columns)}")
+            yield self._process_chunk(df, file_type)
+
+    def _load_batches(self, conn: sqlite3.Connection, file_type: str, batches: Iterable[pa.Table]) -> None:
+        """Append processed Arrow tables to the table matching their file type."""
+        table = FILE_TYPE_TABLES[file_type]
+        for batch in batches:
+            self._bulk_insert(conn, table, batch)
+            logging.info(f"Added {batch.num_rows} {table.replace('_', ' ')} records")
+
+    async def _upload_all(self, schema: OffChainSchema) -> Tuple[str, str]:
+        """Upload the schema and the encrypted database over one HTTP session, returning both IPFS hashes."""
+        async with aiohttp.ClientSession(timeout=IPFS_CLIENT_TIMEOUT) as session:
+            # Start the schema upload first so it overlaps with encrypting the database
+            schema_upload = asyncio.create_task(upload_json_to_ipfs_async(session, schema.model_dump()))
             
-            # Handle formats like "1:23:45" or "23:45"
-            parts = str(duration_str).split(':')
-            if len(parts) == 3:  # HH:MM:SS
-                hours, minutes, seconds = map(int, parts)
-                return hours * 3600 + minutes * 60 + seconds
-            elif len(parts) == 2:  # MM:SS
-                minutes, seconds = map(int, parts)
-                return minutes * 60 + seconds
-            else:
-                return 0
-        except:
-            return 0
+            # Encrypt in memory and upload the ciphertext without a round trip through disk
+            encrypted_stream = await asyncio.to_thread(
+                encrypt_file_to_stream, settings.REFINEMENT_ENCRYPTION_KEY, self.db_path
+            )
+            encrypted_size = encrypted_stream.getbuffer().nbytes
+            logging.info(f"Encrypted file size: {encrypted_size} bytes")
+            print(f"Encrypted file size: {encrypted_size} bytes")
+            
+            file_upload = upload_fileobj_to_ipfs_async(
+                session, encrypted_stream, f"{os.path.basename(self.db_path)}.pgp"
+            )
+            schema_ipfs_hash, ipfs_hash = await asyncio.gather(schema_upload, file_upload)
+            return schema_ipfs_hash, ipfs_hash
 
     def transform(self) -> Output:
         """Transform Netflix CSV files into SQLite database."""
@@ -158,59 +419,54 @@ class Refiner:
         account_id = self._hash_wallet_address(wallet_address)
         logging.info(f"Using account_id: {account_id} for wallet: {wallet_address[:10]}...")
         
+        # Start from a fresh database so the account_id column default always matches this wallet
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+            logging.info(f"Deleted existing database at {self.db_path}")
+        
         # Create SQLite database
-        with sqlite3.connect(self.db_path) as conn:
-            # Debug: Check what files are in input directory
-            input_files = os.listdir(settings.INPUT_DIR)
-            logging.info(f"Found {len(input_files)} files in input directory: {input_files}")
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            self._configure_connection(conn)
+            self._create_tables(conn, account_id)
             
-            for input_filename in input_files:
-                input_file = os.path.join(settings.INPUT_DIR, input_filename)
-                if os.path.splitext(input_file)[1].lower() == '.csv':
-                    logging.info(f"Processing {input_filename}")
-                    
-                    # Read CSV file
-                    df = pd.read_csv(input_file)
-                    logging.info(f"Loaded CSV with {len(df)} rows and columns: {list(df.columns)}")
-                    
-                    # Detect file type
-                    file_type = self._detect_file_type(df)
-                    logging.info(f"Detected file type: {file_type}")
-                    
-                    if file_type == 'viewing':
-                        # Process viewing activity
-                        processed_df = self._process_viewing_activity(df, account_id)
-                        processed_df.to_sql("viewing_activity", conn, if_exists="append", index=False)
-                        logging.info(f"Added {len(processed_df)} viewing activity records")
-                        
-                    elif file_type == 'billing':
-                        # Process billing history
-                        processed_df = self._process_billing_history(df, account_id)
-                        processed_df.to_sql("billing_history", conn, if_exists="append", index=False)
-                        logging.info(f"Added {len(processed_df)} billing history records")
-                        
+            csv_files = []
+            with os.scandir(settings.INPUT_DIR) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith('.csv'):
+                        csv_files.append(entry.path)
                     else:
-                        logging.warning(f"Unknown file type for {input_filename}, attempting fallback processing")
-                        # Fallback: try to process as viewing activity first
-                        try:
-                            processed_df = self._process_viewing_activity(df, account_id)
-                            processed_df.to_sql("viewing_activity", conn, if_exists="append", index=False)
-                            logging.info(f"Fallback: Added {len(processed_df)} viewing activity records")
-                        except Exception as e:
-                            logging.warning(f"Fallback viewing processing failed: {e}")
-                            # Try billing processing as second fallback
-                            try:
-                                processed_df = self._process_billing_history(df, account_id)
-                                processed_df.to_sql("billing_history", conn, if_exists="append", index=False)
-                                logging.info(f"Fallback: Added {len(processed_df)} billing history records")
-                            except Exception as e2:
-                                logging.error(f"All fallback processing failed: {e2}")
-                                # Last resort: just add the raw data
-                                df['account_id'] = account_id
-                                df.to_sql("raw_data", conn, if_exists="append", index=False)
-                                logging.info(f"Added {len(df)} raw data records as last resort")
-                else:
-                    logging.info(f"Skipping non-CSV file: {input_filename}")
+                        logging.info(f"Skipping non-CSV file: {entry.name}")
+            
+            # Debug: Check what files are in input directory
+            logging.info(f"Found {len(csv_files)} CSV files in input directory: {[os.path.basename(f) for f in csv_files]}")
+            
+            # Only files read in one go are worth a worker; larger ones are streamed chunk by chunk below
+            pooled_files = [f for f in csv_files if os.path.getsize(f) <= PYARROW_MAX_FILE_SIZE]
+            if len(pooled_files) <= 1:
+                # A single file gains nothing from a process pool, so parse it straight into the database
+                pooled_files = []
+            streamed_files = [f for f in csv_files if f not in pooled_files]
+            
+            # Load every file inside one transaction instead of committing per file
+            with conn:
+                if pooled_files:
+                    # Parse files in parallel; workers hand back Arrow tables and only this process writes
+                    max_workers = min(len(pooled_files), os.cpu_count() or 1)
+                    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                        for file_type, batches in executor.map(_refine_csv_file, pooled_files):
+                            if file_type != 'unknown':
+                                self._load_batches(conn, file_type, batches)
+                
+                for input_file in streamed_files:
+                    file_type, read_options = self._detect_csv_file(input_file)
+                    if file_type != 'unknown':
+                        self._load_batches(conn, file_type, self._process_csv_file(input_file, file_type, read_options))
+                
+                # Build indexes once all rows are in, rather than maintaining them on every insert
+                self._create_indexes(conn)
+            
+            # Checkpoint the WAL back into the database file before it is measured and encrypted
+            conn.execute("PRAGMA journal_mode=DELETE")
             
             # Debug: Check database size after processing
             db_size = os.path.getsize(self.db_path)
@@ -227,85 +483,35 @@ class Refiner:
                 count = cursor.fetchone()[0]
                 logging.info(f"Table {table[0]}: {count} rows")
 
-        # Generate Netflix schema dynamically to ensure correct schema
-        netflix_schema = {
-            "tables": {
-                "viewing_activity": {
-                    "columns": {
-                        "account_id": "TEXT",
-                        "duration": "TEXT",
-                        "duration_sec": "INTEGER",
-                        "start_time": "TEXT",
-                        "profile_name": "TEXT",
-                        "country": "TEXT",
-                        "bookmark": "TEXT",
-                        "latest_bookmark": "TEXT",
-                        "supplemental_video_type": "TEXT",
-                        "attributes": "TEXT",
-                        "device_type": "TEXT",
-                        "title": "TEXT"
-                    }
-                },
-                "billing_history": {
-                    "columns": {
-                        "account_id": "TEXT",
-                        "transaction_date": "TEXT",
-                        "country": "TEXT",
-                        "mop_last_4": "TEXT",
-                        "final_invoice_result": "TEXT",
-                        "mop_pmt_processor_desc": "TEXT",
-                        "pmt_txn_type": "TEXT",
-                        "description": "TEXT",
-                        "gross_sale_amt": "REAL",
-                        "pmt_status": "TEXT",
-                        "payment_type": "TEXT",
-                        "tax_amt": "REAL",
-                        "service_period_start_date": "TEXT",
-                        "item_price_amt": "REAL",
-                        "mop_creation_date": "TEXT",
-                        "currency": "TEXT",
-                        "next_billing_date": "TEXT",
-                        "service_period_end_date": "TEXT"
-                    }
-                }
-            }
-        }
-        
         # Create schema object with correct Netflix schema
         schema = OffChainSchema(
             name="netflix-csv",
             version="1.0.0",
             description="Netflix viewing activity and billing history data",
             dialect="sqlite",
-            schema=json.dumps(netflix_schema)  # <-- use generated schema
+            schema=json.dumps(NETFLIX_SCHEMA)
         )
         output.schema = schema
         
-        # Upload schema to IPFS
-        schema_ipfs_hash = upload_json_to_ipfs(schema.model_dump())
-        logging.info(f"Schema uploaded to IPFS with hash: {schema_ipfs_hash}")
-        
         # Debug: Check database before encryption
         db_size_before = os.path.getsize(self.db_path)
         logging.info(f"Database size before encryption: {db_size_before} bytes")
         print(f"Database size before encryption: {db_size_before} bytes")
         
-        # Encrypt and upload database to IPFS
-        encrypted_path = encrypt_file(settings.REFINEMENT_ENCRYPTION_KEY, self.db_path)
-        
-        # Debug: Check encrypted file size and path
-        print(f"encrypted → {encrypted_path}, exists: {os.path.exists(encrypted_path)}")
-        if encrypted_path and os.path.exists(encrypted_path):
-            encrypted_size = os.path.getsize(encrypted_path)
-            logging.info(f"Encrypted file size: {encrypted_size} bytes")
-            print(f"Encrypted file size: {encrypted_size} bytes")
-        else:
-            logging.error(f"Encrypted file not found: {encrypted_path}")
-            print(f"Encrypted file not found: {encrypted_path}")
-        
-        ipfs_hash = upload_file_to_ipfs(encrypted_path)
+        # Encrypt and upload database and schema to IPFS
+        schema_ipfs_hash, ipfs_hash = asyncio.run(self._upload_all(schema))
+        logging.info(f"Schema uploaded to IPFS with hash: {schema_ipfs_hash}")
         logging.info(f"Uploaded to IPFS with hash: {ipfs_hash}")
         output.refinement_url = f"{settings.IPFS_GATEWAY_URL}/{ipfs_hash}"
         
         logging.info("Netflix CSV data transformation completed successfully")
-        return output
\ No newline at end of file
+        return output
+
+
+def _refine_csv_file(input_file: str) -> Tuple[str, List[pa.Table]]:
+    """Process pool worker: parse and process one CSV file small enough to read whole, returning its file type and Arrow tables."""
+    refiner = Refiner()
+    file_type, read_options = refiner._detect_csv_file(input_file)
+    if file_type == 'unknown':
+        return file_type, []
+    return file_type, list(refiner._process_csv_file(input_file, file_type, read_options))
@@ -1,9 +1,22 @@
 import pgpy
 from pgpy.constants import CompressionAlgorithm, HashAlgorithm
+import io
 import os
 from refiner.config import settings
 
 
+def _encrypt(encryption_key: str, file_path: str) -> bytes:
+    """Symmetrically encrypts the contents of a file into an ASCII-armored PGP message."""
+    with open(file_path, 'rb') as f:
+        buffer = f.read()
+    
+    message = pgpy.PGPMessage.new(buffer, compression=CompressionAlgorithm.ZLIB)
+    encrypted_message = message.encrypt(
+        passphrase=encryption_key, hash=HashAlgorithm.SHA512
+    )
+    return str(encrypted_message).encode()
+
+
 def encrypt_file(encryption_key: str, file_path: str, output_path: str = None) -> str:
     """Symmetrically encrypts a file with an encryption key.
 
@@ -20,21 +33,34 @@ def encrypt_file(encryption_key: str, file_path: str, output_path: str = None) -
     
     print(f"🔐 Encrypting {file_path} ({os.path.getsize(file_path)} bytes) to {output_path}")
     
-    with open(file_path, 'rb') as f:
-        buffer = f.read()
-    
-    message = pgpy.PGPMessage.new(buffer, compression=CompressionAlgorithm.ZLIB)
-    encrypted_message = message.encrypt(
-        passphrase=encryption_key, hash=HashAlgorithm.SHA512
-    )
-    
     with open(output_path, 'wb') as f:
-        f.write(str(encrypted_message).encode())
+        f.write(_encrypt(encryption_key, file_path))
     
     print(f"✅ Encrypted file created: {output_path} ({os.path.getsize(output_path)} bytes)")
     return output_path
 
 
+def encrypt_file_to_stream(encryption_key: str, file_path: str) -> io.BytesIO:
+    """Symmetrically encrypts a file into an in-memory stream.
+
+    pgpy builds the whole encrypted message in memory anyway, so handing that
+    buffer straight to an upload avoids writing it to disk and reading it back.
+
+    Args:
+        encryption_key: The passphrase to encrypt with
+        file_path: Path to the file to encrypt
+
+    Returns:
+        Binary file object positioned at the start of the encrypted data
+    """
+    print(f"🔐 Encrypting {file_path} ({os.path.getsize(file_path)} bytes) in memory")
+    
+    stream = io.BytesIO(_encrypt(encryption_key, file_path))
+    
+    print(f"✅ Encrypted stream created ({stream.getbuffer().nbytes} bytes)")
+    return stream
+
+
 def decrypt_file(encryption_key: str, file_path: str, output_path: str = None) -> str:
     """Symmetrically decrypts a file with an encryption key.
 
@@ -1,12 +1,17 @@
+import asyncio
 import json
 import logging
 import os
+import aiohttp
 import requests
 from refiner.config import settings
 
 PINATA_FILE_API_ENDPOINT = "https://api.pinata.cloud/pinning/pinFileToIPFS"
 PINATA_JSON_API_ENDPOINT = "https://api.pinata.cloud/pinning/pinJSONToIPFS"
 
+# aiohttp sessions default to a 5 minute total timeout, which large uploads can exceed; only bound connecting by default
+IPFS_CLIENT_TIMEOUT = aiohttp.ClientTimeout(total=settings.IPFS_UPLOAD_TIMEOUT, sock_connect=30)
+
 def upload_json_to_ipfs(data):
     """
     Uploads JSON data to IPFS using Pinata API.
@@ -49,7 +54,20 @@ def upload_file_to_ipfs(file_path=None):
     
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
-        
+
+    size = os.path.getsize(file_path)
+    logging.info(f"⏫ Uploading {file_path} ({size} bytes) to IPFS")
+    
+    with open(file_path, 'rb') as file:
+        return upload_fileobj_to_ipfs(file, os.path.basename(file_path))
+
+def upload_fileobj_to_ipfs(fileobj, filename):
+    """
+    Uploads the contents of an open binary file object to IPFS using Pinata API (https://pinata.cloud/)
+    :param fileobj: Readable binary file object, positioned at the start of the data
+    :param filename: Name to give the uploaded file
+    :return: IPFS hash
+    """
     if not settings.PINATA_API_KEY or not settings.PINATA_API_SECRET:
         raise Exception("Error: Pinata IPFS API credentials not found, please check your environment variables")
 
@@ -59,18 +77,14 @@ def upload_file_to_ipfs(file_path=None):
     }
 
     try:
-        size = os.path.getsize(file_path)
-        logging.info(f"⏫ Uploading {file_path} ({size} bytes) to IPFS")
-        
-        with open(file_path, 'rb') as file:
-            files = {
-                'file': file
-            }
-            response = requests.post(
-                PINATA_FILE_API_ENDPOINT,
-                files=files,
-                headers=headers
-            )
+        files = {
+            'file': (filename, fileobj)
+        }
+        response = requests.post(
+            PINATA_FILE_API_ENDPOINT,
+            files=files,
+            headers=headers
+        )
         
         response.raise_for_status()
         result = response.json()
@@ -81,6 +95,72 @@ def upload_file_to_ipfs(file_path=None):
         logging.error(f"An error occurred while uploading file to IPFS: {e}")
         raise e
 
+async def upload_json_to_ipfs_async(session, data):
+    """
+    Uploads JSON data to IPFS using Pinata API over a shared aiohttp session.
+    :param session: aiohttp.ClientSession to send the request with (connections are reused across uploads)
+    :param data: JSON data to upload (dictionary or list)
+    :return: IPFS hash
+    """
+    if not settings.PINATA_API_KEY or not settings.PINATA_API_SECRET:
+        raise Exception("Error: Pinata IPFS API credentials not found, please check your environment variables")
+
+    headers = {
+        "Content-Type": "application/json",
+        "pinata_api_key": settings.PINATA_API_KEY,
+        "pinata_secret_api_key": settings.PINATA_API_SECRET
+    }
+
+    try:
+        async with session.post(
+            PINATA_JSON_API_ENDPOINT,
+            data=json.dumps(data),
+            headers=headers
+        ) as response:
+            response.raise_for_status()
+            result = await response.json()
+
+        logging.info(f"Successfully uploaded JSON to IPFS with hash: {result['IpfsHash']}")
+        return result['IpfsHash']
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"An error occurred while uploading JSON to IPFS: {e}")
+        raise e
+
+async def upload_fileobj_to_ipfs_async(session, fileobj, filename):
+    """
+    Uploads the contents of an open binary file object to IPFS using Pinata API over a shared aiohttp session.
+    :param session: aiohttp.ClientSession to send the request with (connections are reused across uploads)
+    :param fileobj: Readable binary file object, positioned at the start of the data
+    :param filename: Name to give the uploaded file
+    :return: IPFS hash
+    """
+    if not settings.PINATA_API_KEY or not settings.PINATA_API_SECRET:
+        raise Exception("Error: Pinata IPFS API credentials not found, please check your environment variables")
+
+    headers = {
+        "pinata_api_key": settings.PINATA_API_KEY,
+        "pinata_secret_api_key": settings.PINATA_API_SECRET
+    }
+
+    try:
+        form = aiohttp.FormData()
+        form.add_field('file', fileobj, filename=filename)
+        async with session.post(
+            PINATA_FILE_API_ENDPOINT,
+            data=form,
+            headers=headers
+        ) as response:
+            response.raise_for_status()
+            result = await response.json()
+
+        logging.info(f"Successfully uploaded file to IPFS with hash: {result['IpfsHash']}")
+        return result['IpfsHash']
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"An error occurred while uploading file to IPFS: {e}")
+        raise e
+
 # Test with: python -m refiner.utils.ipfs
 if __name__ == "__main__":
     ipfs_hash = upload_file_to_ipfs()